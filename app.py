@@ -1,20 +1,68 @@
 import streamlit as st
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Document , Settings
+from llama_index.core import VectorStoreIndex, Document, Settings, StorageContext, load_index_from_storage
 from llama_index.llms.groq import Groq
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.vector_stores.faiss import FaissVectorStore
+from llama_index.embeddings.huggingface_optimum import OptimumEmbedding
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from transformers import AutoTokenizer
+import streamlit.components.v1 as components
 import folium
-from streamlit_folium import folium_static
+import faiss
+import hashlib
+import httpx
 import os
 
-# Initialize embedding model
+EMBED_MODEL_NAME = "BAAI/bge-small-en-v1.5"
+EMBED_DIM = 384
+EMBED_QUERY_INSTRUCTION = "Represent this question for searching relevant passages: "
+QUANTIZED_EMBED_DIR = "./bge-small-int8"
+QUANTIZED_EMBED_FILE = "model_quantized.onnx"
+INDEX_ROOT = "./idx_store"
+# Bump when the on-disk index format changes so stale stores are rebuilt
+INDEX_FORMAT = "faiss-sq8-ip-v1"
+
+# Export the embedding model to ONNX and quantize it to int8 (run once)
+def quantize_embeddings():
+    model = ORTModelForFeatureExtraction.from_pretrained(EMBED_MODEL_NAME, export=True)
+    tokenizer = AutoTokenizer.from_pretrained(EMBED_MODEL_NAME)
+    
+    quantizer = ORTQuantizer.from_pretrained(model)
+    qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=True)
+    quantizer.quantize(save_dir=QUANTIZED_EMBED_DIR, quantization_config=qconfig)
+    tokenizer.save_pretrained(QUANTIZED_EMBED_DIR)
+
+# Initialize embedding model (loaded once per process)
+@st.cache_resource
 def setup_embeddings():
-    embed_model = HuggingFaceEmbedding(
-        model_name="BAAI/bge-small-en-v1.5"
+    if not os.path.exists(os.path.join(QUANTIZED_EMBED_DIR, QUANTIZED_EMBED_FILE)):
+        with st.spinner("Preparing the embedding model (first run only)..."):
+            quantize_embeddings()
+    
+    model = ORTModelForFeatureExtraction.from_pretrained(
+        QUANTIZED_EMBED_DIR,
+        file_name=QUANTIZED_EMBED_FILE
+    )
+    # The instruction can't be inferred from a local folder name
+    embed_model = OptimumEmbedding(
+        folder_name=QUANTIZED_EMBED_DIR,
+        model=model,
+        query_instruction=EMBED_QUERY_INSTRUCTION,
+        embed_batch_size=32
     )
     return embed_model
 
+# Shared keep-alive HTTP/2 connection pool for Groq API calls
+@st.cache_resource
+def _groq_http_client():
+    return httpx.Client(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=20)
+    )
+
 # Initialize Groq LLM
 def init_llm():
     api_key = st.secrets.get("GROQ_API_KEY", os.getenv("GROQ_API_KEY", ""))
@@ -24,34 +72,85 @@ def init_llm():
     
     llm = Groq(
         api_key=api_key,
-        model="mixtral-8x7b-32768",
+        model="llama-3.1-8b-instant",
         temperature=0.1,
-        max_tokens=2048,
+        max_tokens=512,
+        timeout=30,
+        max_retries=2,
+        http_client=_groq_http_client(),
     )
     # Set as default LLM
     Settings.llm = llm
     return llm
 
 # Create sample data
-def create_sample_data():
-    bus_stops = {
+@st.cache_resource
+def _bus_stops():
+    return {
         "Stazione FS": (45.4184, 11.8801),
         "Prato della Valle": (45.3989, 11.8714),
         "Basilica del Santo": (45.4019, 11.8808),
         "Piazza delle Erbe": (45.4078, 11.8762),
         "Ospedale": (45.4109, 11.8888)
     }
+
+# Refreshed once a minute rather than on every rerun
+@st.cache_data(ttl=60)
+def _reports(bus_stops_keys: tuple):
+    bus_stops = _bus_stops()
     
     reports = pd.DataFrame({
-        "location": list(bus_stops.keys()),
-        "coordinates": list(bus_stops.values()),
-        "timestamp": [datetime.now() - timedelta(minutes=x) for x in range(5)],
+        "location": list(bus_stops_keys),
+        "coordinates": [bus_stops[name] for name in bus_stops_keys],
+        "timestamp": [datetime.now() - timedelta(minutes=x) for x in range(len(bus_stops_keys))],
         "delay_minutes": [5, 10, 0, 15, 7],
         "crowd_level": ["Medium", "High", "Low", "Medium", "High"],
         "safety_score": [4.5, 3.8, 4.8, 4.2, 3.9]
     })
+    reports['location'] = reports['location'].astype('category')
+    reports = reports.set_index('location')
+    
+    reports['color'] = np.select(
+        [reports.safety_score >= 4.5, reports.safety_score >= 4.0],
+        ['green', 'orange'],
+        default='red'
+    )
+    reports['popup_text'] = reports.apply(
+        lambda report: f"""
+        <b>{report.name}</b><br>
+        Delay: {report['delay_minutes']} mins<br>
+        Crowd: {report['crowd_level']}<br>
+        Safety Score: {report['safety_score']}/5.0
+        """,
+        axis=1
+    )
+    
+    # Per-stop lookup built in the same cache generation as the frame
+    report_by_loc = reports.to_dict('index')
     
-    return bus_stops, reports
+    return reports, report_by_loc
+
+# Build the transit map once per data change and reuse the rendered HTML
+@st.cache_data(ttl=60)
+def build_map_html(map_rows: tuple):
+    # Create map centered on Padova
+    m = folium.Map(location=[45.4064, 11.8768], zoom_start=14)
+    
+    # Add markers for each bus stop
+    for coords, color, popup_text in map_rows:
+        folium.Marker(
+            coords,
+            popup=popup_text,
+            icon=folium.Icon(color=color)
+        ).add_to(m)
+    
+    return m.get_root().render()
+
+# Key the persisted index on everything it is built from, so a changed
+# document, embedding model or storage format falls through to a rebuild
+def index_persist_dir(safety_docs):
+    key = "\n".join([INDEX_FORMAT, EMBED_MODEL_NAME, *(doc.text for doc in safety_docs)])
+    return os.path.join(INDEX_ROOT, hashlib.sha1(key.encode()).hexdigest()[:12])
 
 # Initialize LlamaIndex with Groq
 @st.cache_resource
@@ -69,29 +168,70 @@ def init_index():
         Document(text="Emergency procedures include immediate notification of authorities and trusted contacts."),
         Document(text="Bus line 10 connects Stazione FS to the University area with stops at major landmarks.")
     ]
+    persist_dir = index_persist_dir(safety_docs)
+    
+    # Reuse the persisted index instead of re-embedding on cold start
+    if os.path.exists(os.path.join(persist_dir, "docstore.json")):
+        try:
+            vector_store = FaissVectorStore.from_persist_dir(persist_dir)
+            storage_context = StorageContext.from_defaults(
+                vector_store=vector_store,
+                persist_dir=persist_dir
+            )
+            return load_index_from_storage(storage_context, embed_model=embed_model)
+        except Exception as e:
+            st.warning(f"Could not load saved index, rebuilding: {str(e)}")
     
     try:
-        index = VectorStoreIndex.from_documents(
+        embeddings = embed_model.get_text_embedding_batch([doc.text for doc in safety_docs])
+        for doc, embedding in zip(safety_docs, embeddings):
+            doc.embedding = embedding
+        
+        # Store vectors as int8 codes; bge embeddings are normalized, so
+        # inner product is cosine similarity. The quantizer ranges are
+        # trained on the bootstrap docs before anything is added.
+        # Limitation: with only three training vectors each dimension's
+        # min/max comes from three values, so vectors inserted later are
+        # clipped to that range. Retrain on a larger calibration set (or
+        # rebuild the store) before growing the corpus.
+        faiss_index = faiss.IndexScalarQuantizer(
+            EMBED_DIM,
+            faiss.ScalarQuantizer.QT_8bit,
+            faiss.METRIC_INNER_PRODUCT
+        )
+        faiss_index.train(np.array(embeddings, dtype=np.float32))
+        vector_store = FaissVectorStore(faiss_index=faiss_index)
+        storage_context = StorageContext.from_defaults(vector_store=vector_store)
+        index = VectorStoreIndex(
             safety_docs,
+            storage_context=storage_context,
             llm=llm,
             embed_model=embed_model
         )
-        return index
     except Exception as e:
         st.error(f"Error initializing index: {str(e)}")
         return None
     
+    # A failed write (e.g. read-only filesystem) must not discard a built index
+    try:
+        index.storage_context.persist(persist_dir=persist_dir)
+    except Exception as e:
+        st.warning(f"Could not save index to disk: {str(e)}")
+    return index
+    
     
+# Yields the recommendation token by token for st.write_stream
 def get_safety_recommendation(query_engine, location, time_of_day):
     if not query_engine:
-        return "AI features are currently unavailable. Please check API configuration."
+        yield "AI features are currently unavailable. Please check API configuration."
+        return
     
     try:
         query = f"What are the safety recommendations for traveling near {location} during {time_of_day}?"
         response = query_engine.query(query)
-        return response.response
+        yield from response.response_gen
     except Exception as e:
-        return f"Unable to get safety recommendations at this time: {str(e)}"
+        yield f"Unable to get safety recommendations at this time: {str(e)}"
 
 def main():
     st.set_page_config(page_title="SafeTransit Padova", layout="wide")
@@ -102,9 +242,14 @@ def main():
     if 'emergency_mode' not in st.session_state:
         st.session_state.emergency_mode = False
     
-    # Initialize LlamaIndex
-    index = init_index()
-    query_engine = index.as_query_engine(llm=Settings.llm) if index else None
+    # Initialize LlamaIndex; exceptions aren't cached, so a failed
+    # first-run model export is retried on the next rerun
+    try:
+        index = init_index()
+    except Exception as e:
+        st.error(f"Error initializing AI features: {str(e)}")
+        index = None
+    query_engine = index.as_query_engine(llm=Settings.llm, streaming=True) if index else None
 
     # Header with language selection
     col1, col2 = st.columns([4, 1])
@@ -119,50 +264,40 @@ def main():
     
     # Rest of your code remains the same until AI features
     tabs = st.tabs(["Real-time Map", "Report Update", "Safety Features"])
-    bus_stops, reports = create_sample_data()
+    bus_stops = _bus_stops()
+    reports, report_by_loc = _reports(tuple(bus_stops.keys()))
     
     # Real-time Map Tab
     with tabs[0]:
         st.subheader("Real-time Transit Map")
         
-        # Create map centered on Padova
-        m = folium.Map(location=[45.4064, 11.8768], zoom_start=14)
-        
-        # Add markers for each bus stop
-        for name, coords in bus_stops.items():
-            report = reports[reports['location'] == name].iloc[0]
-            color = 'green' if report['safety_score'] >= 4.5 else 'orange' if report['safety_score'] >= 4.0 else 'red'
-            
-            popup_text = f"""
-            <b>{name}</b><br>
-            Delay: {report['delay_minutes']} mins<br>
-            Crowd: {report['crowd_level']}<br>
-            Safety Score: {report['safety_score']}/5.0
-            """
-            
-            folium.Marker(
+        map_rows = tuple(
+            (
                 coords,
-                popup=popup_text,
-                icon=folium.Icon(color=color)
-            ).add_to(m)
-        
-        folium_static(m)
+                report_by_loc[name]['color'],
+                report_by_loc[name]['popup_text']
+            )
+            for name, coords in bus_stops.items()
+        )
+        components.html(build_map_html(map_rows), height=500)
         
         st.subheader("Latest Updates")
         st.dataframe(
-            reports[['location', 'timestamp', 'delay_minutes', 'crowd_level', 'safety_score']]
+            reports[['timestamp', 'delay_minutes', 'crowd_level', 'safety_score']]
         )
         
         # AI Safety Insights (with error handling)
         if st.button("Get AI Safety Insights") and query_engine:
             current_time = datetime.now().strftime("%H:%M")
+            st.markdown("🤖 **AI Safety Insight:**")
             with st.spinner("Analyzing safety patterns..."):
-                insight = get_safety_recommendation(
-                    query_engine,
-                    "Padova city center",
-                    current_time
+                st.write_stream(
+                    get_safety_recommendation(
+                        query_engine,
+                        "Padova city center",
+                        current_time
+                    )
                 )
-                st.info(f"🤖 AI Safety Insight: {insight}")
     
     # The rest of your tabs code remains the same...
 